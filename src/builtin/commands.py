@@ -1,8 +1,14 @@
 import os
 import re
+import resource
 import shlex
 import sys
 
+from utils.variables import variable_store, ASSIGNMENT_PATTERN, NAME_PATTERN
+from utils.capture import capture_store, replay_to_fd
+from external.jobs import job_controller
+from external.limits import LIMIT_OPTIONS, get_limit, set_limit
+
 HISTORY_LIST = []
 
 
@@ -15,19 +21,37 @@ class AliasManager:
 
     def load_aliases(self):
         """从配置文件加载别名"""
-        if os.path.exists(self.config_file):
-            try:
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        line = line.strip()
-                        if line and not line.startswith('#'):
-                            match = re.match(r'alias\s+(\w+)=[\'"]?(.*?)[\'"]?$', line)
-                            if match:
-                                alias_name = match.group(1)
-                                alias_value = match.group(2).strip('\'"')
-                                self.aliases[alias_name] = alias_value
-            except Exception as e:
-                print(f"加载别名配置失败: {e}", file=sys.stderr)
+        aliases = self._read_config()
+        if aliases is not None:
+            self.aliases.update(aliases)
+
+    def reload_aliases(self):
+        """配置文件被其他会话修改后重新加载，只有内容变化时才替换，返回是否变化"""
+        aliases = self._read_config()
+        if aliases is None or aliases == self.aliases:
+            return False
+        self.aliases = aliases
+        return True
+
+    def _read_config(self):
+        """读取配置文件中的别名；文件不存在（如被其他会话删除）时为空表，读取失败时返回 None"""
+        if not os.path.exists(self.config_file):
+            return {}
+        aliases = {}
+        try:
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        match = re.match(r'alias\s+(\w+)=[\'"]?(.*?)[\'"]?$', line)
+                        if match:
+                            alias_name = match.group(1)
+                            alias_value = match.group(2).strip('\'"')
+                            aliases[alias_name] = alias_value
+        except Exception as e:
+            print(f"加载别名配置失败: {e}", file=sys.stderr)
+            return None
+        return aliases
 
     def save_aliases(self):
         """保存别名到配置文件"""
@@ -117,6 +141,14 @@ MyShell (Python) Built-in Commands:
     history       Show command history.
     alias [name[='value']]  Manage command aliases.
     unalias name  Remove an alias.
+    export [name[=value] ...]  Export variables to child processes.
+    unset name    Remove a variable.
+    set           Show all shell variables.
+    capture [on|off|list|clear]  Record output of recent commands.
+    replay [n] [file]  Replay captured output to the terminal, a file or a pipeline.
+    ulimit [-SH] [-a | -cdfnstuv [limit]]  Set resource limits for child processes.
+    jobs          Show running and queued background jobs.
+    admission [-j max_jobs] [-l max_load] | off  Queue background jobs above thresholds.
     """
     print(help_text)
     return False
@@ -175,6 +207,188 @@ def builtin_unalias(args):
     return False
 
 
+def builtin_export(args):
+    """内置命令 export: 导出环境变量"""
+    if not args:
+        for name, value in variable_store.list_exported().items():
+            print(f"export {name}='{value}'")
+        return False
+
+    for arg in args:
+        match = ASSIGNMENT_PATTERN.match(arg)
+        if match:
+            variable_store.export(match.group(1), match.group(2))
+        elif NAME_PATTERN.fullmatch(arg):
+            variable_store.export(arg)
+        else:
+            print(f"export: '{arg}': 不是有效的标识符", file=sys.stderr)
+    return False
+
+
+def builtin_unset(args):
+    """内置命令 unset: 删除变量"""
+    if not args:
+        print("用法: unset 变量名", file=sys.stderr)
+        return False
+
+    for name in args:
+        variable_store.unset(name)
+    return False
+
+
+def builtin_set(args):
+    """内置命令 set: 显示所有变量"""
+    for name, value in variable_store.list_variables().items():
+        print(f"{name}='{value}'")
+    return False
+
+
+def builtin_capture(args):
+    """内置命令 capture: 管理命令输出捕获"""
+    action = args[0] if args else 'list'
+    if action == 'on':
+        capture_store.enabled = True
+        print("输出捕获已开启")
+    elif action == 'off':
+        capture_store.enabled = False
+        print("输出捕获已关闭")
+    elif action == 'clear':
+        capture_store.clear()
+    elif action == 'list':
+        state = "开启" if capture_store.enabled else "关闭"
+        print(f"输出捕获: {state}  共 {capture_store.total_size()} 字节")
+        for capture in capture_store.captures.values():
+            flags = ' (文件)' if capture.spilled else ''
+            flags += ' (已截断)' if capture.truncated else ''
+            print(f"{capture.id:>4}  {capture.size:>10}{flags}  {capture.command}")
+    else:
+        print("用法: capture [on|off|list|clear]", file=sys.stderr)
+    return False
+
+
+def builtin_replay(args):
+    """内置命令 replay: 回放捕获的输出到终端或文件"""
+    if len(args) < 2:
+        sys.stdout.flush()
+        replay_to_fd(args, sys.stdout.fileno())
+        return False
+
+    try:
+        fd = os.open(args[1], os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    except OSError as e:
+        print(f"replay: {e}", file=sys.stderr)
+        return False
+    try:
+        replay_to_fd(args[:1], fd)
+    finally:
+        os.close(fd)
+    return False
+
+
+def builtin_ulimit(args):
+    """内置命令 ulimit: 设置子进程的资源限制"""
+    soft = hard = False
+    show_all = False
+    option = '-f'
+    value = None
+    for arg in args:
+        if arg in ('-S', '-H', '-a'):
+            soft = soft or arg == '-S'
+            hard = hard or arg == '-H'
+            show_all = show_all or arg == '-a'
+        elif arg in LIMIT_OPTIONS:
+            option = arg
+        elif value is None and not arg.startswith('-'):
+            value = arg
+        else:
+            print("用法: ulimit [-SH] [-a | -cdfnstuv [limit]]", file=sys.stderr)
+            return False
+
+    def format_limit(res, scale):
+        current = get_limit(res)[1 if hard and not soft else 0]
+        return 'unlimited' if current == resource.RLIM_INFINITY else str(current // scale)
+
+    if show_all:
+        for flag, (res, desc, scale) in LIMIT_OPTIONS.items():
+            print(f"{desc:<28}({flag}) {format_limit(res, scale)}")
+        return False
+
+    res, _, scale = LIMIT_OPTIONS[option]
+    if value is None:
+        print(format_limit(res, scale))
+        return False
+
+    if value == 'unlimited':
+        limit = resource.RLIM_INFINITY
+    else:
+        try:
+            limit = int(value) * scale
+        except ValueError:
+            print(f"ulimit: {value}: 无效的数字", file=sys.stderr)
+            return False
+
+    # 未指定 -S/-H 时同时设置软、硬限制
+    if not soft and not hard:
+        soft = hard = True
+    try:
+        set_limit(res, limit, soft, hard)
+    except ValueError as e:
+        print(f"ulimit: {e}", file=sys.stderr)
+    return False
+
+
+def builtin_jobs(args):
+    """内置命令 jobs: 显示后台作业和排队状态"""
+    job_controller.poll()
+    if job_controller.enabled:
+        max_jobs = job_controller.max_jobs if job_controller.max_jobs is not None else '-'
+        max_load = job_controller.max_load if job_controller.max_load is not None else '-'
+        print(f"准入控制: 最大作业数 {max_jobs}  最大负载 {max_load}  "
+              f"当前负载 {os.getloadavg()[0]:.2f}")
+    for pid, command in job_controller.running.items():
+        print(f"[{pid}] 运行中  {command}")
+    for i, (command, _) in enumerate(job_controller.queue, 1):
+        print(f"[排队 {i}] 等待中  {command}")
+    return False
+
+
+def builtin_admission(args):
+    """内置命令 admission: 配置后台作业准入控制"""
+    if not args:
+        return builtin_jobs(args)
+
+    if args == ['off']:
+        job_controller.max_jobs = None
+        job_controller.max_load = None
+        job_controller.poll()
+        print("准入控制已关闭")
+        return False
+
+    max_jobs = job_controller.max_jobs
+    max_load = job_controller.max_load
+    try:
+        i = 0
+        while i < len(args):
+            if args[i] == '-j' and i + 1 < len(args):
+                max_jobs = int(args[i + 1])
+            elif args[i] == '-l' and i + 1 < len(args):
+                max_load = float(args[i + 1])
+            else:
+                raise ValueError(args[i])
+            i += 2
+        # 上限为 0 或负数时所有作业都会永远排队
+        if (max_jobs is not None and max_jobs < 1) or (max_load is not None and max_load <= 0):
+            raise ValueError(args)
+    except ValueError:
+        print("用法: admission [-j 最大作业数] [-l 最大负载] | off（上限必须为正数）", file=sys.stderr)
+        return False
+
+    job_controller.max_jobs = max_jobs
+    job_controller.max_load = max_load
+    job_controller.poll()
+    return False
+
+
 # ================== 内置命令字典 ==================
 # 内置命令字典：命令名称 -> 执行函数
 builtin_commands = {
@@ -186,4 +400,12 @@ builtin_commands = {
     "history": builtin_history,
     "alias": builtin_alias,  # 新增
     "unalias": builtin_unalias,  # 新增（注意：这里之前少了函数引用）
+    "export": builtin_export,
+    "unset": builtin_unset,
+    "set": builtin_set,
+    "capture": builtin_capture,
+    "replay": builtin_replay,
+    "ulimit": builtin_ulimit,
+    "jobs": builtin_jobs,
+    "admission": builtin_admission,
 }
\ No newline at end of file
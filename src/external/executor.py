@@ -1,28 +1,43 @@
 import os
+import select
 import sys
+import time
 
+from utils.variables import variable_store
+from utils.capture import capture_store, find_capture, open_capture_pty
+from .jobs import job_controller, ADMISSION_INTERVAL
+from .limits import apply_resource_limits, resource_limits
+from .redirection import FileTable, build_plan, apply_plan, writes_fd, DUP2
 
-def execute_external(cmd_tokens, background=False, redirections=None, is_pipeline=False, pipeline_commands=None):
+# 系统不支持 pidfd 时，检查前台命令是否已退出的间隔（秒）
+EXIT_POLL_INTERVAL = 0.05
+
+
+def execute_external(cmd_tokens, background=False, redirections=None, is_pipeline=False, pipeline_commands=None,
+                     assignments=None):
     """
-    使用 fork/exec 机制执行外部命令，支持后台运行、I/O重定向和管道
+    使用 fork/exec（或 posix_spawn）机制执行外部命令，支持后台运行、I/O重定向和管道
 
     Args:
         cmd_tokens (list): 包含命令及其参数的列表（或命令列表的列表，如果是管道）
         background (bool): 是否在后台运行
-        redirections (dict): 重定向信息
+        redirections (list): 重定向列表 [(fd, 操作符, 目标), ...]；管道时为每个命令各自的重定向列表
         is_pipeline (bool): 是否是管道命令
         pipeline_commands (list): 管道中的命令列表（仅当is_pipeline=True时使用）
+        assignments (list): 前缀赋值 [(变量名, 值), ...]；管道时为每个命令各自的前缀赋值列表
     """
     if redirections is None:
-        redirections = {}
+        redirections = [[] for _ in pipeline_commands] if is_pipeline else []
+    if assignments is None:
+        assignments = [[] for _ in pipeline_commands] if is_pipeline else []
 
     try:
         if is_pipeline:
             # 执行管道命令
-            execute_pipeline(pipeline_commands, background, redirections)
+            execute_pipeline(pipeline_commands, background, redirections, assignments)
         else:
             # 原来的单命令执行逻辑
-            execute_single_command(cmd_tokens, background, redirections)
+            execute_single_command(cmd_tokens, background, redirections, assignments)
 
     except OSError as e:
         print(f"mysh: fork 失败: {e}", file=sys.stderr)
@@ -32,64 +47,52 @@ def execute_external(cmd_tokens, background=False, redirections=None, is_pipelin
         print(f"mysh: 意外错误: {e}", file=sys.stderr)
 
 
-def execute_single_command(cmd_tokens, background, redirections):
+def execute_single_command(cmd_tokens, background, redirections, assignments):
     """执行单个命令"""
+    # 前缀赋值（FOO=bar cmd）只叠加到子进程的环境块上，不修改 os.environ
+    envp = variable_store.build_envp(assignments)
+
     if background:
-        # 后台运行代码（双重fork）
-        pid1 = os.fork()
-        if pid1 == 0:
-            try:
-                os.setsid()
-                pid2 = os.fork()
-                if pid2 == 0:
-                    # 设置重定向
-                    setup_redirections(redirections)
-                    try:
-                        os.execvp(cmd_tokens[0], cmd_tokens)
-                    except FileNotFoundError:
-                        sys.exit(127)
-                    except PermissionError:
-                        sys.exit(126)
-                    except Exception:
-                        sys.exit(1)
-                else:
-                    os._exit(0)
-            except Exception:
-                os._exit(1)
-        else:
-            os.waitpid(pid1, 0)
-            print(f"[{pid1}] 后台进程已启动")
-    else:
-        # 前台运行
-        pid = os.fork()
-        if pid == 0:
-            # 子进程代码
-            try:
-                # 设置重定向
-                setup_redirections(redirections)
-                os.execvp(cmd_tokens[0], cmd_tokens)
-            except FileNotFoundError:
-                print(f"mysh: 命令未找到: {cmd_tokens[0]}", file=sys.stderr)
-                sys.exit(127)
-            except PermissionError:
-                print(f"mysh: 权限不足: {cmd_tokens[0]}", file=sys.stderr)
-                sys.exit(126)
-            except Exception as e:
-                print(f"mysh: 执行错误 '{cmd_tokens[0]}': {e}", file=sys.stderr)
-                sys.exit(1)
-        else:
-            # 父进程代码
-            _, status = os.waitpid(pid, 0)
+        # 后台运行：交给作业管理器做准入控制，可能先排队再启动。
+        # 工作目录和资源限制在提交时确定，与作业何时真正启动无关
+        cwd = os.getcwd()
+        limits = dict(resource_limits)
+        job_controller.submit(' '.join(cmd_tokens),
+                              lambda: _spawn_background(cmd_tokens, redirections, envp, cwd, limits))
+        return
 
-            if os.WIFEXITED(status):
-                exit_code = os.WEXITSTATUS(status)
-            elif os.WIFSIGNALED(status):
-                signal_num = os.WTERMSIG(status)
-                print(f"\n进程被信号终止: {signal_num}", file=sys.stderr)
+    # 前台运行：在父进程中打开文件并生成重定向计划
+    capture_pipe = _open_capture_pipe(redirections)
+    files = FileTable()
+    pid = None
+    try:
+        try:
+            plan = build_plan(redirections, files,
+                              stdout_fd=capture_pipe[1] if capture_pipe else None)
+        except OSError as e:
+            print(f"mysh: 重定向错误: {e}", file=sys.stderr)
+            variable_store.last_status = 1
+            return
+        pid = _spawn(cmd_tokens, envp, plan)
+    finally:
+        files.close()
+        if capture_pipe:
+            os.close(capture_pipe[1])
+            # 命令没有启动（重定向失败、命令不存在或启动时出错）时读端不会交给 _wait_foreground
+            if pid is None:
+                os.close(capture_pipe[0])
+
+    if pid is None:
+        return
+    status = _wait_foreground(pid, capture_pipe, ' '.join(cmd_tokens))
+    variable_store.last_status = _exit_status(status)
+    if os.WIFSIGNALED(status):
+        signal_num = os.WTERMSIG(status)
+        print(f"\n进程被信号终止: {signal_num}", file=sys.stderr)
 
 
-def execute_pipeline(commands, background, redirections):
-    """执行管道命令"""
+def execute_pipeline(commands, background, redirections, assignments):
+    """执行管道命令，每个命令按各自的重定向计划设置描述符"""
     if background:
         print("mysh: 管道命令暂不支持后台运行")
         return
@@ -98,92 +101,258 @@ def execute_pipeline(commands, background, redirections):
         print("mysh: 管道需要至少两个命令")
         return
 
-    # 保存原始的stdin和stdout
-    original_stdin = os.dup(sys.stdin.fileno())
-    original_stdout = os.dup(sys.stdout.fileno())
-
+    pipes = []
+    files = FileTable()
+    capture_pipe = None
+    pids = []
+    last_pid = None
     try:
-        # 创建管道
-        pipes = []
+        # 创建管道（不可继承，exec 后自动关闭）
         for i in range(len(commands) - 1):
-            pipe_read, pipe_write = os.pipe()
-            pipes.append((pipe_read, pipe_write))
+            pipes.append(os.pipe())
+        capture_pipe = _open_capture_pipe(redirections[-1])
 
-        # 执行每个命令
-        pids = []
         for i, cmd_tokens in enumerate(commands):
-            pid = os.fork()
-            if pid == 0:
-                # 子进程
-                try:
-                    # 设置输入重定向
-                    if i > 0:  # 不是第一个命令，从上一个管道读取
-                        os.dup2(pipes[i - 1][0], sys.stdin.fileno())
-
-                    # 设置输出重定向
-                    if i < len(commands) - 1:  # 不是最后一个命令，写入到下一个管道
-                        os.dup2(pipes[i][1], sys.stdout.fileno())
-                    else:  # 最后一个命令，处理文件重定向
-                        setup_redirections(redirections)
-
-                    # 关闭所有管道文件描述符
-                    for pipe_read, pipe_write in pipes:
-                        os.close(pipe_read)
-                        os.close(pipe_write)
-
-                    # 恢复原始标准输入输出
-                    os.close(original_stdin)
-                    os.close(original_stdout)
-
-                    # 执行命令
-                    os.execvp(cmd_tokens[0], cmd_tokens)
-                except FileNotFoundError:
-                    print(f"mysh: 命令未找到: {cmd_tokens[0]}", file=sys.stderr)
-                    sys.exit(127)
-                except PermissionError:
-                    print(f"mysh: 权限不足: {cmd_tokens[0]}", file=sys.stderr)
-                    sys.exit(126)
-                except Exception as e:
-                    print(f"mysh: 执行错误 '{cmd_tokens[0]}': {e}", file=sys.stderr)
-                    sys.exit(1)
+            # 在父进程中预先构建环境块和重定向计划
+            envp = variable_store.build_envp(assignments[i])
+
+            stdin_fd = pipes[i - 1][0] if i > 0 else None
+            if i < len(commands) - 1:
+                stdout_fd = pipes[i][1]
             else:
-                pids.append(pid)
+                stdout_fd = capture_pipe[1] if capture_pipe else None
+            try:
+                plan = build_plan(redirections[i], files, stdin_fd, stdout_fd)
+            except OSError as e:
+                # 该命令不执行，其余命令照常运行（与 bash 一致）
+                print(f"mysh: 重定向错误: {e}", file=sys.stderr)
+                continue
 
-        # 关闭所有管道文件描述符（在父进程中）
+            if i == 0 and cmd_tokens[0] == 'replay':
+                # 管道首个命令为 replay 时，直接把捕获内容写入管道。
+                # 在父进程中查找捕获，使 LRU 顺序的更新生效
+                capture = find_capture(cmd_tokens[1:])
+                if capture is None:
+                    continue
+                pid = _fork_replay(capture, plan)
+            else:
+                pid = _spawn(cmd_tokens, envp, plan)
+            if pid is not None:
+                pids.append(pid)
+                if i == len(commands) - 1:
+                    last_pid = pid
+    except OSError as e:
+        print(f"mysh: 管道执行错误: {e}", file=sys.stderr)
+    finally:
+        # 关闭父进程中的管道和文件
         for pipe_read, pipe_write in pipes:
             os.close(pipe_read)
             os.close(pipe_write)
+        files.close()
+        if capture_pipe:
+            os.close(capture_pipe[1])
+            if last_pid is None:
+                os.close(capture_pipe[0])
 
-        # 等待所有子进程完成
-        for pid in pids:
+    # 等待最后一个命令（同时转发并记录它的输出），以它的退出码作为 $?
+    if last_pid is not None:
+        command = ' | '.join(' '.join(cmd_tokens) for cmd_tokens in commands)
+        status = _wait_foreground(last_pid, capture_pipe, command)
+        variable_store.last_status = _exit_status(status)
+    for pid in pids:
+        if pid != last_pid:
             os.waitpid(pid, 0)
 
-    except Exception as e:
-        print(f"mysh: 管道执行错误: {e}", file=sys.stderr)
+
+def _wait_foreground(pid, capture_pipe=None, command=''):
+    """
+    等待前台命令结束，返回 waitpid 的状态。
+    开启输出捕获时同时转发并记录输出；命令退出后只读完已写入的数据，
+    不再等待仍持有输出端的后台子进程（如 sh -c 'sleep 3 & echo started'）。
+    有排队的后台作业时，等待期间每隔 ADMISSION_INTERVAL 秒检查一次准入条件。
+    capture_pipe 的读端在返回前会被关闭。
+    """
+    if capture_pipe is None and not job_controller.queue:
+        _, status = os.waitpid(pid, 0)
+        return status
+
+    read_fd = capture_pipe[0] if capture_pipe else None
+    out_fd = sys.stdout.fileno()
+    exit_fd = _open_pidfd(pid)
+    capture = capture_store.start(command) if capture_pipe else None
+    sys.stdout.flush()
+    try:
+        reading = read_fd is not None
+        last_poll = time.monotonic()
+        while not _has_exited(pid):
+            fds = [fd for fd in (read_fd if reading else None, exit_fd) if fd is not None]
+            timeout = None
+            if job_controller.queue:
+                timeout = ADMISSION_INTERVAL
+            if exit_fd is None:
+                timeout = min(timeout or EXIT_POLL_INTERVAL, EXIT_POLL_INTERVAL)
+            ready, _, _ = select.select(fds, [], [], timeout)
+            if reading and read_fd in ready:
+                reading = capture_store.forward(read_fd, out_fd, capture)
+            if job_controller.queue and time.monotonic() - last_poll >= ADMISSION_INTERVAL:
+                # 在正常的控制流中启动排队的作业（不在信号处理函数中）
+                job_controller.poll()
+                last_poll = time.monotonic()
+        # 命令已退出：读完缓冲区中剩余的数据，不阻塞
+        while reading and select.select([read_fd], [], [], 0)[0]:
+            reading = capture_store.forward(read_fd, out_fd, capture)
     finally:
-        # 恢复原始标准输入输出
-        os.dup2(original_stdin, sys.stdin.fileno())
-        os.dup2(original_stdout, sys.stdout.fileno())
-        os.close(original_stdin)
-        os.close(original_stdout)
+        if read_fd is not None:
+            os.close(read_fd)
+            capture_store.commit(capture)
+        if exit_fd is not None:
+            os.close(exit_fd)
+
+    _, status = os.waitpid(pid, 0)
+    return status
 
 
-def setup_redirections(redirections):
-    """设置输入输出重定向（保持不变）"""
-    for redir_type, filename in redirections.items():
+def _open_pidfd(pid):
+    """打开进程的 pidfd（进程退出时可读），不支持时返回 None"""
+    if not hasattr(os, 'pidfd_open'):
+        return None
+    try:
+        return os.pidfd_open(pid)
+    except OSError:
+        return None
+
+
+def _has_exited(pid):
+    """子进程是否已经结束（不回收，之后仍由 waitpid 取得退出状态）"""
+    try:
+        return os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+    except ChildProcessError:
+        return True
+
+
+def _spawn(cmd_tokens, envp, plan, setsid=False, cwd=None, limits=None):
+    """
+    按重定向计划启动命令，返回子进程 pid（命令无法执行时返回 None）。
+    没有资源限制时使用 posix_spawn，计划直接作为 file_actions；否则 fork 后执行同一计划。
+
+    Args:
+        cwd (str): 子进程的工作目录（默认与 Shell 相同）
+        limits (dict): 子进程的资源限制（默认为当前 ulimit 设置）
+    """
+    if limits is None:
+        limits = resource_limits
+    if cwd == os.getcwd():
+        cwd = None
+
+    # 在父进程中按子进程环境的 PATH 查找命令，两种启动方式的查找结果一致
+    path = _resolve_command(cmd_tokens[0], envp, cwd)
+    if path is None:
+        print(f"mysh: 命令未找到: {cmd_tokens[0]}", file=sys.stderr)
+        variable_store.last_status = 127
+        return None
+
+    if _can_posix_spawn(plan, cwd, limits):
+        try:
+            return os.posix_spawn(path, cmd_tokens, envp,
+                                  file_actions=plan, setsid=setsid)
+        except FileNotFoundError:
+            print(f"mysh: 命令未找到: {cmd_tokens[0]}", file=sys.stderr)
+            variable_store.last_status = 127
+            return None
+        except PermissionError:
+            print(f"mysh: 权限不足: {cmd_tokens[0]}", file=sys.stderr)
+            variable_store.last_status = 126
+            return None
+
+    pid = os.fork()
+    if pid == 0:
+        # 子进程代码
         try:
-            if redir_type == '>':  # 输出重定向（覆盖）
-                fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
-                os.dup2(fd, sys.stdout.fileno())
-                os.close(fd)
-            elif redir_type == '>>':  # 输出重定向（追加）
-                fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
-                os.dup2(fd, sys.stdout.fileno())
-                os.close(fd)
-            elif redir_type == '<':  # 输入重定向
-                fd = os.open(filename, os.O_RDONLY)
-                os.dup2(fd, sys.stdin.fileno())
-                os.close(fd)
-        except IOError as e:
+            if setsid:
+                os.setsid()
+            if cwd is not None:
+                os.chdir(cwd)
+            apply_plan(plan)
+            apply_resource_limits(limits)
+            os.execve(path, cmd_tokens, envp)
+        except FileNotFoundError:
+            print(f"mysh: 命令未找到: {cmd_tokens[0]}", file=sys.stderr)
+            os._exit(127)
+        except PermissionError:
+            print(f"mysh: 权限不足: {cmd_tokens[0]}", file=sys.stderr)
+            os._exit(126)
+        except BaseException as e:
+            print(f"mysh: 执行错误 '{cmd_tokens[0]}': {e}", file=sys.stderr)
+            os._exit(1)
+    return pid
+
+
+def _resolve_command(name, envp, cwd=None):
+    """
+    按环境块中的 PATH（而不是 Shell 自身的 os.environ）查找可执行文件，
+    含 '/' 的命令名直接使用；相对路径按 cwd 判断。找不到时返回 None
+    """
+    if '/' in name:
+        return name
+    path = os.fsdecode(envp.get(b'PATH', os.fsencode(os.defpath)))
+    for path_dir in path.split(os.pathsep):
+        candidate = os.path.join(path_dir or '.', name)
+        full_path = os.path.join(cwd, candidate) if cwd else candidate
+        if os.path.isfile(full_path) and os.access(full_path, os.X_OK):
+            return candidate
+    return None
+
+
+def _can_posix_spawn(plan, cwd, limits):
+    """
+    posix_spawn 无法设置资源限制和工作目录；
+    关闭操作在部分 libc 上对未打开的描述符会失败
+    """
+    return (hasattr(os, 'posix_spawn') and not limits and cwd is None
+            and all(action[0] == DUP2 for action in plan))
+
+
+def _fork_replay(capture, plan):
+    """fork 一个子进程，把捕获的输出按重定向计划写出（replay 作为管道的第一个命令）"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            apply_plan(plan)
+            capture.replay(sys.stdout.fileno())
+            os._exit(0)
+        except BrokenPipeError:
+            os._exit(0)
+        except BaseException:
+            os._exit(1)
+    return pid
+
+
+def _spawn_background(cmd_tokens, redirections, envp, cwd, limits):
+    """启动一个后台作业（新会话），返回子进程 pid，由作业管理器负责回收"""
+    # 作业可能排队后才启动，所以在启动时才打开重定向文件（相对路径按提交时的目录解析）
+    files = FileTable(cwd)
+    try:
+        try:
+            plan = build_plan(redirections, files)
+        except OSError as e:
             print(f"mysh: 重定向错误: {e}", file=sys.stderr)
-            sys.exit(1)
\ No newline at end of file
+            return None
+        return _spawn(cmd_tokens, envp, plan, setsid=True, cwd=cwd, limits=limits)
+    finally:
+        files.close()
+
+
+def _open_capture_pipe(redirections):
+    """输出捕获开启且标准输出没有被重定向时，创建捕获用的伪终端 (读端, 写端)"""
+    if not capture_store.enabled or writes_fd(redirections, 1):
+        return None
+    return open_capture_pty(sys.stdout.fileno())
+
+
+def _exit_status(status):
+    """将 waitpid 返回的状态转换为 Shell 退出码（被信号终止时为 128+信号值）"""
+    if os.WIFEXITED(status):
+        return os.WEXITSTATUS(status)
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+    return 1
@@ -0,0 +1,77 @@
+import os
+from collections import deque
+
+# 有作业排队时，等待输入期间每隔多少秒重新检查一次准入条件
+ADMISSION_INTERVAL = 1.0
+
+
+class JobController:
+    """
+    后台作业管理与准入控制。
+
+    正在运行的作业数或系统负载超过阈值时，新的后台作业会进入队列，
+    等有空闲容量时再按提交顺序启动。队列只在正常的控制流中处理（显示提示符前、
+    等待输入或前台命令时定期检查），不在信号处理函数中 fork。
+    """
+
+    def __init__(self):
+        self.max_jobs = None  # 同时运行的后台作业上限
+        self.max_load = None  # 1 分钟平均负载上限
+        self.running = {}  # pid -> 命令字符串
+        self.queue = deque()  # (命令字符串, 启动函数)
+
+    @property
+    def enabled(self):
+        return self.max_jobs is not None or self.max_load is not None
+
+    def submit(self, command, launch):
+        """
+        提交一个后台作业。
+
+        Args:
+            command (str): 用于显示的命令字符串
+            launch (callable): 启动作业的函数，返回子进程 pid
+        """
+        self.poll()
+        if self.queue or not self._admit():
+            self.queue.append((command, launch))
+            print(f"[排队 {len(self.queue)}] {command}")
+            return
+        self._start(command, launch)
+
+    def poll(self):
+        """回收已结束的作业，并在有容量时启动排队的作业"""
+        for pid in list(self.running):
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done:
+                del self.running[pid]
+
+        while self.queue and self._admit():
+            command, launch = self.queue.popleft()
+            self._start(command, launch)
+
+    def _admit(self):
+        """判断当前是否可以启动新作业"""
+        if self.max_jobs is not None and len(self.running) >= self.max_jobs:
+            return False
+        if self.max_load is not None and os.getloadavg()[0] >= self.max_load:
+            return False
+        return True
+
+    def _start(self, command, launch):
+        try:
+            pid = launch()
+        except OSError as e:
+            print(f"mysh: fork 失败: {e}")
+            return None
+        if pid is not None:
+            self.running[pid] = command
+            print(f"[{pid}] 后台进程已启动")
+        return pid
+
+
+# 创建全局作业管理器实例
+job_controller = JobController()
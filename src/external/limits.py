@@ -0,0 +1,65 @@
+import os
+import resource
+import sys
+
+# ulimit 选项 -> (资源, 说明, 单位字节数)，单位与 bash 保持一致
+LIMIT_OPTIONS = {
+    '-c': (resource.RLIMIT_CORE, 'core file size (blocks)', 1024),
+    '-d': (resource.RLIMIT_DATA, 'data seg size (kbytes)', 1024),
+    '-f': (resource.RLIMIT_FSIZE, 'file size (blocks)', 1024),
+    '-n': (resource.RLIMIT_NOFILE, 'open files', 1),
+    '-s': (resource.RLIMIT_STACK, 'stack size (kbytes)', 1024),
+    '-t': (resource.RLIMIT_CPU, 'cpu time (seconds)', 1),
+    '-u': (resource.RLIMIT_NPROC, 'max user processes', 1),
+    '-v': (resource.RLIMIT_AS, 'virtual memory (kbytes)', 1024),
+}
+
+# 子进程中要设置的资源限制：资源 -> (soft, hard)
+resource_limits = {}
+
+
+def get_limit(res):
+    """获取子进程将使用的限制（未设置时为 Shell 自身的限制）"""
+    if res in resource_limits:
+        return resource_limits[res]
+    return resource.getrlimit(res)
+
+
+def set_limit(res, value, soft=True, hard=True):
+    """
+    记录资源限制，在之后启动的子进程中生效（不修改 Shell 自身）。
+
+    Raises:
+        ValueError: 限制值不合法
+    """
+    cur_soft, cur_hard = get_limit(res)
+    new_soft = value if soft else cur_soft
+    new_hard = value if hard else cur_hard
+
+    if not hard and _exceeds(new_soft, new_hard):
+        raise ValueError("软限制不能超过硬限制")
+    if hard and not soft and _exceeds(cur_soft, new_hard):
+        new_soft = new_hard
+    _, shell_hard = resource.getrlimit(res)
+    if os.geteuid() != 0 and _exceeds(new_hard, shell_hard):
+        raise ValueError("没有权限提高硬限制")
+    resource_limits[res] = (new_soft, new_hard)
+
+
+def apply_resource_limits(limits=None):
+    """在子进程 exec 之前应用资源限制（limits 为提交作业时保存的快照，默认使用当前设置）"""
+    if limits is None:
+        limits = resource_limits
+    for res, (soft, hard) in limits.items():
+        try:
+            resource.setrlimit(res, (soft, hard))
+        except (ValueError, OSError) as e:
+            print(f"mysh: 设置资源限制失败: {e}", file=sys.stderr)
+            os._exit(1)
+
+
+def _exceeds(a, b):
+    """比较两个限制值（RLIM_INFINITY 视为无穷大）"""
+    if b == resource.RLIM_INFINITY:
+        return False
+    return a == resource.RLIM_INFINITY or a > b
@@ -0,0 +1,140 @@
+import fcntl
+import os
+
+# 重定向计划中的两种操作，与 os.posix_spawn 的 file_actions 格式一致
+DUP2 = getattr(os, 'POSIX_SPAWN_DUP2', 2)
+CLOSE = getattr(os, 'POSIX_SPAWN_CLOSE', 1)
+
+# 文件重定向的打开方式
+OPEN_FLAGS = {
+    '>': os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+    '>>': os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+    '<': os.O_RDONLY,
+}
+
+
+class FileTable:
+    """
+    一条命令行中重定向用到的文件。同一文件以同一方式写入时只打开一次，
+    由所有管道阶段共享；读取的文件每次单独打开，各阶段有各自的读取位置。
+    父进程打开的描述符都是不可继承的，exec 时自动关闭。
+    相对路径按 cwd 解析（默认为当前工作目录）。
+    """
+
+    def __init__(self, cwd=None):
+        self.cwd = cwd
+        self.fds = {}  # (路径, 打开方式) -> fd
+        self._extra = []
+
+    def open(self, path, flags):
+        if self.cwd is not None:
+            path = os.path.join(self.cwd, path)
+        if flags == os.O_RDONLY:
+            fd = os.open(path, flags)
+            self._extra.append(fd)
+            return fd
+        key = (os.path.abspath(path), flags)
+        fd = self.fds.get(key)
+        if fd is None:
+            fd = os.open(path, flags, 0o644)
+            self.fds[key] = fd
+        return fd
+
+    def move_above(self, fd, lowest):
+        """把 fd 复制到不小于 lowest 的位置，避免与用户指定的描述符冲突"""
+        new_fd = fcntl.fcntl(fd, fcntl.F_DUPFD_CLOEXEC, lowest)
+        self._extra.append(new_fd)
+        return new_fd
+
+    def close(self):
+        for fd in list(self.fds.values()) + self._extra:
+            os.close(fd)
+        self.fds.clear()
+        self._extra = []
+
+
+def build_plan(redirections, files, stdin_fd=None, stdout_fd=None):
+    """
+    在父进程中为一个命令（管道中的一个阶段）生成重定向计划。
+
+    Args:
+        redirections (list): 解析得到的重定向 [(fd, 操作符, 目标), ...]，按出现顺序
+        files (FileTable): 共享的文件表
+        stdin_fd (int): 管道输入端（没有时为 None）
+        stdout_fd (int): 管道或捕获管道的输出端（没有时为 None）
+
+    Returns:
+        list: 按顺序执行的操作 [(DUP2, 源, 目标) | (CLOSE, fd)]，可直接作为 posix_spawn 的 file_actions
+
+    Raises:
+        OSError: 打开重定向文件失败
+    """
+    # 先记录每个 dup2 的源是否为父进程打开的描述符，以便处理编号冲突
+    steps = []
+    if stdin_fd is not None:
+        steps.append((DUP2, stdin_fd, 0, True))
+    if stdout_fd is not None:
+        steps.append((DUP2, stdout_fd, 1, True))
+
+    for fd, op, target in redirections:
+        if op in OPEN_FLAGS:
+            steps.append((DUP2, files.open(target, OPEN_FLAGS[op]), fd, True))
+        elif target == '-':
+            steps.append((CLOSE, fd, None, False))
+        else:
+            steps.append((DUP2, int(target), fd, False))
+
+    # 用户显式使用的高位描述符（如 3>file）可能与父进程打开的描述符编号相同，
+    # 此时把父进程的描述符移到更高的位置
+    user_fds = {fd for fd, _, _ in redirections if fd > 2}
+    lowest = max(user_fds, default=0) + 1
+    moved = {}
+    actions = []
+    for kind, src, dst, owned in steps:
+        if kind == CLOSE:
+            actions.append((CLOSE, src))
+            continue
+        if owned and src in user_fds:
+            if src not in moved:
+                moved[src] = files.move_above(src, lowest)
+            src = moved[src]
+        actions.append((DUP2, src, dst))
+
+    return _optimize(actions)
+
+
+def _optimize(actions):
+    """去掉无效操作：源与目标相同的 dup2，以及结果在被读取之前就被覆盖的操作"""
+    result = []
+    overwritten = set()  # 之后会被直接覆盖（且在此之前没有被读取）的描述符
+    for action in reversed(actions):
+        if action[0] == DUP2:
+            _, src, dst = action
+            if src == dst or dst in overwritten:
+                continue
+            overwritten.add(dst)
+            overwritten.discard(src)
+        else:
+            if action[1] in overwritten:
+                continue
+            overwritten.add(action[1])
+        result.append(action)
+    result.reverse()
+    return result
+
+
+def apply_plan(actions):
+    """在 fork 出的子进程中执行重定向计划"""
+    for action in actions:
+        if action[0] == DUP2:
+            os.dup2(action[1], action[2])
+        else:
+            try:
+                os.close(action[1])
+            except OSError:
+                pass
+
+
+def writes_fd(redirections, fd):
+    """重定向中是否改变了 fd"""
+    return any(target_fd == fd for target_fd, _, _ in redirections)
@@ -3,19 +3,26 @@ import sys
 import os
 import tty
 import termios
+import codecs
+import select
+from collections import deque
 
 # 将项目根目录添加到 Python 路径，确保模块可以正确导入
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 # 导入自定义模块（在pycharm上跑时在每个库前面加一个“.”，不然会报错，在Linux上跑不要加!!!）
 from builtin.commands import HISTORY_LIST, alias_manager
-from utils.helpers import print_prompt
+from utils.helpers import print_prompt, print_continuation_prompt, display_width
 from parser.parser import parse_input
 from builtin.builtin import is_builtin_command, execute_builtin
 from external.executor import execute_external
 from utils.wildcard_expander import WildcardExpander
 from utils.completer import CommandCompleter
 from utils.tab_handler import TabHandler
+from utils.variables import variable_store
+from external.jobs import job_controller, ADMISSION_INTERVAL
+from utils.watcher import create_watcher
+from utils.highlighter import SyntaxHighlighter, continuation_reason
 
 # from .builtin.commands import HISTORY_LIST
 # from .utils.helpers import print_prompt
@@ -26,6 +33,13 @@ from utils.tab_handler import TabHandler
 # 全局补全器实例
 completer = None
 tab_handler = None
+# 输入行语法高亮器
+highlighter = None
+# PATH 与别名配置监视器（不支持 inotify 的系统上为 None）
+watcher = None
+# 已从终端读取、尚未处理的字符（直接读取文件描述符，以便用 select 设置超时）
+pending_input = deque()
+input_decoder = codecs.getincrementaldecoder(sys.stdin.encoding or 'utf-8')('replace')
 
 def main_loop():
     """Shell 的主循环"""
@@ -33,14 +47,18 @@ def main_loop():
 
     while status:
         try:
-            print_prompt()
-            user_input = get_input().strip()
+            # 回收已结束的后台作业，并启动可以放行的排队作业
+            job_controller.poll()
+            # 处理 PATH 目录与别名配置的变化
+            if watcher is not None:
+                watcher.poll()
+            user_input = read_command().strip()
             if not user_input:
                 continue
             HISTORY_LIST.append(user_input)
 
             # 解析输入（现在返回 tokens, background, redirections）
-            commands, background, redirections, has_pipe = parse_input(user_input)
+            commands, background, redirections, has_pipe, assignments = parse_input(user_input)
             if not commands:
                 continue
 
@@ -49,17 +67,22 @@ def main_loop():
                 if background:
                     print("mysh: 管道命令暂不支持后台运行")
                     continue
-                # 检查管道中是否有内置命令
-                for cmd_tokens in commands:
-                    if is_builtin_command(cmd_tokens[0]):
+                # 检查管道中是否有内置命令（replay 可以作为管道的第一个命令）
+                for index, cmd_tokens in enumerate(commands):
+                    if is_builtin_command(cmd_tokens[0]) and not (index == 0 and cmd_tokens[0] == 'replay'):
                         print("mysh: 管道中不支持内置命令")
                         break
                 else:
                     # 执行外部管道命令
-                    execute_external(None, background, redirections, True, commands)
+                    execute_external(None, background, redirections, True, commands, assignments)
             else:
                 # 单命令处理
                 command_tokens = commands[0]
+                if not command_tokens:
+                    # 只有赋值（FOO=bar），设置为 Shell 变量
+                    for name, value in assignments[0]:
+                        variable_store.set(name, value)
+                    continue
                 command_name = command_tokens[0]
                 args = command_tokens[1:]
 
@@ -68,7 +91,7 @@ def main_loop():
                     if background:
                         print("mysh: 内置命令不支持后台运行")
                         continue
-                    if redirections:
+                    if redirections[0]:
                         print("mysh: 内置命令不支持重定向")
                         continue
 
@@ -78,7 +101,8 @@ def main_loop():
                         print("MyShell已退出")
                 else:
                     # 执行外部命令，传递 background 和 redirections 参数
-                    execute_external(command_tokens, background, redirections)
+                    execute_external(command_tokens, background, redirections[0],
+                                     assignments=assignments[0])
 
         except KeyboardInterrupt:
             print("\n使用 'exit' 或 'logout' 退出。")
@@ -88,8 +112,31 @@ def main_loop():
         except Exception as e:
             print(f"发生意外错误: {e}", file=sys.stderr)
 
-def get_input():
-    """改进的输入函数，正确处理退格键并确保终端设置恢复"""
+def read_command():
+    """读取一条完整命令；引号未闭合、以 | 结尾或行尾为反斜杠时显示续行提示符继续读取"""
+    text = get_input(prompt=print_prompt)
+    while True:
+        reason = continuation_reason(text)
+        if reason is None:
+            return text
+        if reason == 'backslash':
+            text = text[:-1]  # 去掉行尾反斜杠，直接与下一行相连
+        elif reason == 'quote':
+            text += '\n'  # 引号内保留换行
+        else:
+            text += ' '
+        text += get_input(text, print_continuation_prompt)
+
+
+def get_input(base='', prompt=print_prompt):
+    """
+    改进的输入函数，正确处理退格键并确保终端设置恢复
+
+    Args:
+        base (str): 续行时之前已输入的内容，用于语法高亮的上下文
+        prompt (callable): 显示提示符的函数，返回提示符占用的列数
+    """
+    prompt_width = prompt()
     if os.name != 'posix':
         try:
             return input()
@@ -104,9 +151,14 @@ def get_input():
         input_chars = []
         line_printed = False  # 跟踪是否已经打印了内容
         cursor_pos = 0
+        screen_pos = 0  # 终端光标实际所在的位置
+
+        if highlighter is None:
+            init_completers()
+        highlighter.reset(base)
 
         while True:
-            ch = sys.stdin.read(1)
+            ch = _read_char(fd, old_settings)
 
             # Tab键处理
             if ch == '\t' or ch == '\x09':
@@ -115,62 +167,60 @@ def get_input():
 
                 cwd = os.getcwd()
                 current_input = ''.join(input_chars)
+                # 候选列表从输入末尾之后开始显示
+                _write(_cursor_motion(current_input, prompt_width, screen_pos, len(input_chars)))
+                screen_pos = len(input_chars)
 
                 new_input, new_pos, applied = tab_handler.handle_tab(
                     current_input, cursor_pos, cwd
                 )
 
                 if applied:
-                    # 清空行并重新显示
-                    sys.stdout.write('\r' + ' ' * 80 + '\r')
-                    sys.stdout.flush()
-
                     input_chars = list(new_input)
                     cursor_pos = new_pos
-
-                    # 重新显示
-                    sys.stdout.write(''.join(input_chars))
-                    sys.stdout.flush()
-                    line_printed = True
+                elif len(tab_handler.last_completions) > 1:
+                    # 显示了候选列表，重新显示提示符，光标在输入的起始位置
+                    prompt_width = prompt()
+                    screen_pos = 0
+
+                # 重新高亮显示整行
+                line = ''.join(input_chars)
+                highlighter.update(line, 0)
+                _redraw(line, prompt_width, screen_pos, 0, cursor_pos)
+                screen_pos = cursor_pos
+                line_printed = True
 
                 continue
 
             # 方向键处理和其他特殊键（简单实现左右移动）
             elif ch == '\x1b':  # ESC键，可能是方向键
-                next_ch = sys.stdin.read(1)
+                next_ch = _read_char(fd, old_settings)
                 if next_ch == '[':
-                    direction = sys.stdin.read(1)
+                    direction = _read_char(fd, old_settings)
                     # 左箭头: \x1b[D, 右箭头: \x1b[C
                     if direction == 'D' and cursor_pos > 0:
                         cursor_pos -= 1
-                        sys.stdout.write('\b')
-                        sys.stdout.flush()
                     elif direction == 'C' and cursor_pos < len(input_chars):
                         cursor_pos += 1
-                        sys.stdout.write('\x1b[C')
-                        sys.stdout.flush()
+                    _write(_cursor_motion(''.join(input_chars), prompt_width, screen_pos, cursor_pos))
+                    screen_pos = cursor_pos
                 continue
 
             elif ch == '\r' or ch == '\n':  # 回车键 - 从文档1优化
-                # 总是输出换行符，确保光标移动到下一行
-                sys.stdout.write('\r\n')
-                sys.stdout.flush()
+                # 先移到输入末尾再换行（输入可能折成多行），确保光标移动到下一行
+                line = ''.join(input_chars)
+                _write(_cursor_motion(line, prompt_width, screen_pos, len(line)) + '\r\n')
                 break
 
             elif ch == '\x7f' or ch == '\x08':  # 退格键或删除键
-                if input_chars:
+                if input_chars and cursor_pos > 0:
                     input_chars.pop(cursor_pos - 1)
                     cursor_pos -= 1
-                    # 重新显示从光标位置到行尾的内容
-                    remaining_chars = input_chars[cursor_pos:]
-                    sys.stdout.write('\r' + ' ' * 80 + '\r')  # 清空当前行
-                    sys.stdout.write(''.join(input_chars))
-
-                    # 如果还有剩余字符，移动光标到正确位置
-                    if cursor_pos < len(input_chars):
-                        sys.stdout.write('\x1b[' + str(len(input_chars) - cursor_pos) + 'D')
-
-                    sys.stdout.flush()
+                    # 增量高亮，只重绘显示发生变化的部分
+                    line = ''.join(input_chars)
+                    redraw_from = highlighter.update(line, cursor_pos)
+                    _redraw(line, prompt_width, screen_pos, redraw_from, cursor_pos)
+                    screen_pos = cursor_pos
                     line_printed = True
 
             elif ch == '\x03':  # Ctrl+C
@@ -183,16 +233,18 @@ def get_input():
 
 
             else:  # 普通字符
+                # 粘贴时已读入的可打印字符一次性插入，只做一次高亮和重绘
+                chars = [ch]
+                while pending_input and pending_input[0].isprintable():
+                    chars.append(pending_input.popleft())
                 # 在光标位置插入字符
-                input_chars.insert(cursor_pos, ch)
-                cursor_pos += 1
-                # 重新显示从插入位置开始的字符
-                sys.stdout.write(''.join(input_chars[cursor_pos - 1:]))
-                # 如果不是在末尾插入，移动光标回正确位置
-                if cursor_pos < len(input_chars):
-                    sys.stdout.write('\x1b[' + str(len(input_chars) - cursor_pos) + 'D')
-
-                sys.stdout.flush()
+                input_chars[cursor_pos:cursor_pos] = chars
+                # 增量高亮，只重绘显示发生变化的部分
+                line = ''.join(input_chars)
+                redraw_from = highlighter.update(line, cursor_pos)
+                cursor_pos += len(chars)
+                _redraw(line, prompt_width, screen_pos, redraw_from, cursor_pos)
+                screen_pos = cursor_pos
                 line_printed = True
 
         return ''.join(input_chars)
@@ -209,12 +261,86 @@ def get_input():
         sys.stdout.write('\x1b[0m')  # 重置所有属性
         sys.stdout.flush()
 
+def _read_char(fd, old_settings):
+    """
+    从终端读取一个字符（EOF 时返回 Ctrl+D）。
+    有排队的后台作业时，每隔 ADMISSION_INTERVAL 秒在这里检查一次准入条件，
+    作业在正常的控制流中启动，而不是在信号处理函数中。
+    """
+    while not pending_input:
+        if job_controller.queue:
+            ready, _, _ = select.select([fd], [], [], ADMISSION_INTERVAL)
+            if not ready:
+                # 启动作业时可能输出错误信息，暂时恢复终端设置
+                raw_settings = termios.tcgetattr(fd)
+                termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+                try:
+                    job_controller.poll()
+                finally:
+                    termios.tcsetattr(fd, termios.TCSADRAIN, raw_settings)
+                continue
+        data = os.read(fd, 1024)
+        if not data:
+            return '\x04'
+        pending_input.extend(input_decoder.decode(data))
+    return pending_input.popleft()
+
+def _redraw(line, prompt_width, screen_pos, redraw_from, cursor_pos):
+    """
+    从 redraw_from 开始重绘输入（带语法高亮），再把光标移到 cursor_pos。
+    输入超过终端宽度时会折成多行，光标按行列移动，并清除到屏幕末尾。
+    """
+    columns = _terminal_columns()
+    output = [_cursor_motion(line, prompt_width, screen_pos, redraw_from, columns)]
+    output.append('\x1b[J')  # 清除到屏幕末尾
+    output.append(highlighter.render(redraw_from))
+    end_column = prompt_width + display_width(line)
+    if redraw_from < len(line) and end_column % columns == 0:
+        # 恰好写满一行时光标停在行尾，换到下一行开头，使光标位置与计算一致
+        output.append('\r\n')
+    output.append(_cursor_motion(line, prompt_width, len(line), cursor_pos, columns))
+    _write(''.join(output))
+
+def _cursor_motion(line, prompt_width, from_pos, to_pos, columns=None):
+    """生成把光标从输入的 from_pos 处移动到 to_pos 处的控制序列（支持跨行）"""
+    if from_pos == to_pos:
+        return ''
+    if columns is None:
+        columns = _terminal_columns()
+    from_row, from_col = divmod(prompt_width + display_width(line[:from_pos]), columns)
+    to_row, to_col = divmod(prompt_width + display_width(line[:to_pos]), columns)
+    output = []
+    if to_row < from_row:
+        output.append('\x1b[' + str(from_row - to_row) + 'A')
+    elif to_row > from_row:
+        output.append('\x1b[' + str(to_row - from_row) + 'B')
+    if to_col != from_col:
+        output.append('\r')
+        if to_col:
+            output.append('\x1b[' + str(to_col) + 'C')
+    return ''.join(output)
+
+def _terminal_columns():
+    try:
+        return os.get_terminal_size(sys.stdout.fileno()).columns or 80
+    except OSError:
+        return 80
+
+def _write(text):
+    if text:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
 def init_completers():
     """初始化补全器"""
-    global completer, tab_handler
+    global completer, tab_handler, highlighter
     completer = CommandCompleter(alias_manager)
     tab_handler = TabHandler(completer)
+    highlighter = SyntaxHighlighter(completer.is_command)
+    if watcher is not None:
+        watcher.completer = completer
 
 if __name__ == "__main__":
     print("欢迎使用MyShell")
+    watcher = create_watcher(alias_manager)
     main_loop()
\ No newline at end of file
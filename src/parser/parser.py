@@ -1,36 +1,174 @@
-import shlex
 import sys
 
+from utils.variables import variable_store, ASSIGNMENT_PATTERN
+
+# 运算符，按长度从长到短匹配；引号内或转义的字符不会被识别为运算符
+OPERATORS = ('&>>', '&>', '>>', '>&', '<&', '&&', '||', '>', '<', '|', '&')
+OPERATOR_CHARS = '|&<>'
+# 重定向运算符：[n]> [n]>> [n]< [n]>&m [n]<&m [n]>&- &> &>>
+REDIRECT_OPERATORS = ('>', '>>', '<', '>&', '<&', '&>', '&>>')
+# 双引号内反斜杠可以转义的字符
+DOUBLE_QUOTE_ESCAPES = '$`"\\\n'
+
+
+def tokenize(text):
+    """
+    按 shell 的引号规则分词，并保留引号信息，只有未加引号的运算符才会被识别。
+
+    Returns:
+        list: ('word', [(文本, 引号), ...], None) 或 ('op', 运算符, fd)。
+              引号为 None（未加引号）、'"' 或 "'"（单引号及转义字符）；
+              fd 是紧贴在重定向符号前、未加引号的数字（如 2>），没有时为 None
+
+    Raises:
+        ValueError: 引号未闭合或行尾有未转义的反斜杠
+    """
+    tokens = []
+    segments = None  # 当前 word 的片段，None 表示不在 word 中
+    i = 0
+    length = len(text)
+
+    while i < length:
+        ch = text[i]
+        if ch.isspace():
+            if segments is not None:
+                tokens.append(('word', segments, None))
+                segments = None
+            i += 1
+            continue
+
+        if ch in OPERATOR_CHARS:
+            fd = None
+            if segments is not None:
+                digits = ''.join(part for part, _ in segments)
+                if ch in '<>' and digits.isdigit() and all(quote is None for _, quote in segments):
+                    fd = int(digits)
+                else:
+                    tokens.append(('word', segments, None))
+                segments = None
+            op = next(op for op in OPERATORS if text.startswith(op, i))
+            tokens.append(('op', op, fd))
+            i += len(op)
+            continue
+
+        if segments is None:
+            segments = []
+        if ch == "'":
+            end = text.find("'", i + 1)
+            if end == -1:
+                raise ValueError("No closing quotation")
+            segments.append((text[i + 1:end], "'"))
+            i = end + 1
+        elif ch == '"':
+            i = _scan_double_quoted(text, i + 1, segments)
+        elif ch == '\\':
+            if i + 1 >= length:
+                raise ValueError("No escaped character")
+            segments.append((text[i + 1], "'"))
+            i += 2
+        else:
+            start = i
+            while i < length and not text[i].isspace() and text[i] not in OPERATOR_CHARS \
+                    and text[i] not in '\'"\\':
+                i += 1
+            segments.append((text[start:i], None))
+
+    if segments is not None:
+        tokens.append(('word', segments, None))
+    return tokens
+
+
+def _scan_double_quoted(text, i, segments):
+    """扫描双引号内的内容（i 为左引号之后的位置），返回右引号之后的位置"""
+    start = i
+    length = len(text)
+    while i < length:
+        ch = text[i]
+        if ch == '"':
+            segments.append((text[start:i], '"'))
+            return i + 1
+        if ch == '\\' and i + 1 < length and text[i + 1] in DOUBLE_QUOTE_ESCAPES:
+            segments.append((text[start:i], '"'))
+            if text[i + 1] != '\n':
+                # 被转义的字符按字面值处理，不参与变量展开
+                segments.append((text[i + 1], "'"))
+            i += 2
+            start = i
+            continue
+        i += 1
+    raise ValueError("No closing quotation")
+
+
+def expand_tokens(tokens):
+    """
+    对分词结果做变量展开。展开得到的内容只会成为 word，不会再被识别为运算符、引号或前缀赋值；
+    命令开头的前缀赋值单独作为 ('assign', (变量名, 值), None) 返回。
+
+    Raises:
+        ValueError: 重定向目标展开后不是恰好一个字段
+    """
+    result = []
+    assigning = True  # 是否还在命令开头的前缀赋值中
+    for kind, value, fd in tokens:
+        if kind == 'op':
+            result.append((kind, value, fd))
+            if value == '|':
+                assigning = True
+            continue
+
+        is_target = bool(result) and result[-1][0] == 'op' and result[-1][1] in REDIRECT_OPERATORS
+        if is_target:
+            fields = variable_store.expand_word(value)
+            if len(fields) != 1:
+                raise ValueError("ambiguous redirect")
+        elif assigning and value[0][1] is None and ASSIGNMENT_PATTERN.match(value[0][0]):
+            # 只有未加引号、写在命令开头的 NAME=value 才是前缀赋值；
+            # 值不做字段拆分（FOO=$BAR 中的空白保留在值中）
+            field = ''.join(variable_store.expand_word(value, split=False))
+            match = ASSIGNMENT_PATTERN.match(field)
+            result.append(('assign', (match.group(1), match.group(2)), None))
+            continue
+        else:
+            assigning = False
+            fields = variable_store.expand_word(value)
+        result.extend(('word', field, None) for field in fields)
+    return result
+
 
 def parse_input(input_string):
     """
-    将输入字符串解析成令牌列表，识别重定向符号、后台运行符号和管道符号
+    将输入字符串解析成令牌列表，识别重定向符号、后台运行符号和管道符号（引号内的符号只作为普通字符）
 
     Args:
         input_string (str): 用户输入的命令行字符串
 
     Returns:
-        tuple: (命令列表, 是否后台运行, 重定向信息字典, 管道信息)
+        tuple: (命令列表, 是否后台运行, 每个命令的重定向列表, 管道信息, 每个命令的前缀赋值)
+               重定向列表中每一项为 (fd, 操作符, 目标)，按出现顺序排列；
+               前缀赋值列表中每一项为 (变量名, 值)
     """
     if not input_string or not input_string.strip():
-        return [], False, {}, False
+        return [], False, [], False, []
 
     try:
+        # 先分词再展开变量，变量的值不会改变命令结构
+        tokens = expand_tokens(tokenize(input_string.strip()))
+
         # 检查是否以 & 结尾（后台运行）
         background = False
-        trimmed_input = input_string.strip()
-
-        if trimmed_input.endswith('&'):
+        if tokens and tokens[-1][:2] == ('op', '&'):
             background = True
-            trimmed_input = trimmed_input[:-1].strip()
-
-        # 使用 shlex.split 可以正确处理带引号的参数
-        tokens = shlex.split(trimmed_input)
+            tokens.pop()
         if not tokens:
-            return [], background, {}, False
+            return [], background, [], False, []
+
+        for kind, value, _ in tokens:
+            if kind == 'op' and value in ('&', '&&', '||'):
+                print(f"语法错误: 不支持的符号 '{value}'", file=sys.stderr)
+                return [], False, [], False, []
 
         # 检查是否有管道符号
-        has_pipe = '|' in tokens
+        has_pipe = ('op', '|', None) in tokens
 
         if has_pipe:
             # 管道处理逻辑
@@ -41,71 +179,105 @@ def parse_input(input_string):
 
     except ValueError as e:
         print(f"Parse error: {e}", file=sys.stderr)
-        return [], False, {}, False
+        return [], False, [], False, []
 
 
 def parse_single_command(tokens, background):
     """解析单个命令（无管道）"""
-    redirections = {}
+    redirections = []
+    assignments = []
     command_tokens = []
     i = 0
 
     while i < len(tokens):
-        token = tokens[i]
-
-        if token in ('>', '>>', '<'):
-            # 找到重定向符号
-            redir_type = token
-            if i + 1 >= len(tokens):
-                print(f"语法错误: 重定向符号 '{token}' 后缺少文件名", file=sys.stderr)
-                return [], False, {}, False
-
-            filename = tokens[i + 1]
-            redirections[redir_type] = filename
-            i += 2  # 跳过重定向符号和文件名
+        if tokens[i][0] == 'assign':
+            assignments.append(tokens[i][1])
+            i += 1
+            continue
+        # 检查是否为重定向
+        parsed = parse_redirection(tokens, i)
+        if parsed is None:
+            return [], False, [], False, []
+        redirs, consumed = parsed
+        if consumed:
+            redirections.extend(redirs)
+            i += consumed  # 跳过重定向符号和文件名
         else:
-            command_tokens.append(token)
+            command_tokens.append(tokens[i][1])
             i += 1
 
-    return [command_tokens], background, redirections, False
+    return [command_tokens], background, [redirections], False, [assignments]
 
 
 def parse_pipeline(tokens, background):
-    """解析管道命令"""
+    """解析管道命令（每个命令有各自的重定向和前缀赋值）"""
     commands = []  # 每个元素是一个命令的token列表
+    redirections = []  # 与 commands 一一对应
+    assignments = []  # 与 commands 一一对应
     current_command = []
-    redirections = {}  # 目前只支持最后一个命令的重定向
+    current_redirections = []
+    current_assignments = []
 
     i = 0
-    while i < len(tokens):
-        token = tokens[i]
+    while i <= len(tokens):
+        token = tokens[i] if i < len(tokens) else ('op', '|', None)
 
-        if token == '|':
-            # 管道符号，保存当前命令并开始新命令
-            if current_command:
-                commands.append(current_command)
-                current_command = []
+        if token[:2] == ('op', '|'):
+            # 管道符号（或输入结束），保存当前命令并开始新命令
+            if not current_command:
+                print("语法错误: 管道符号 '|' 前后都需要命令", file=sys.stderr)
+                return [], False, [], True, []
+            commands.append(current_command)
+            redirections.append(current_redirections)
+            assignments.append(current_assignments)
+            current_command = []
+            current_redirections = []
+            current_assignments = []
             i += 1
-        elif token in ('>', '>>', '<'):
-            # 重定向符号（目前只支持最后一个命令的重定向）
-            redir_type = token
-            if i + 1 >= len(tokens):
-                print(f"语法错误: 重定向符号 '{token}' 后缺少文件名", file=sys.stderr)
-                return [], False, {}, True
-
-            filename = tokens[i + 1]
-            redirections[redir_type] = filename
-            i += 2
+            continue
+
+        if token[0] == 'assign':
+            current_assignments.append(token[1])
+            i += 1
+            continue
+
+        parsed = parse_redirection(tokens, i)
+        if parsed is None:
+            return [], False, [], True, []
+        redirs, consumed = parsed
+        if consumed:
+            current_redirections.extend(redirs)
+            i += consumed
         else:
-            current_command.append(token)
+            current_command.append(token[1])
             i += 1
 
-    # 添加最后一个命令
-    if current_command:
-        commands.append(current_command)
+    return commands, background, redirections, True, assignments
+
+
+def parse_redirection(tokens, i):
+    """
+    识别 tokens[i] 处的重定向
+
+    Returns:
+        tuple: (重定向列表, 消耗的token数)；不是重定向时消耗数为 0；语法错误时返回 None
+    """
+    kind, op, fd = tokens[i]
+    if kind != 'op' or op not in REDIRECT_OPERATORS:
+        return [], 0
+
+    if i + 1 >= len(tokens) or tokens[i + 1][0] != 'word':
+        print(f"语法错误: 重定向符号 '{op}' 后缺少文件名", file=sys.stderr)
+        return None
+    target = tokens[i + 1][1]
 
-    if len(commands) < 2:
-        print("语法错误: 管道符号 '|' 前后都需要命令", file=sys.stderr)
-        return [], False, {}, True
+    if op in ('&>', '&>>'):
+        # &> file 同时重定向标准输出和标准错误
+        return [(1, op[1:], target), (2, '>&', '1')], 2
 
-    return commands, background, redirections, True
\ No newline at end of file
+    if fd is None:
+        fd = 0 if op in ('<', '<&') else 1
+    if op in ('>&', '<&') and not (target.isdigit() or target == '-'):
+        print(f"语法错误: '{op}' 需要文件描述符或 '-'", file=sys.stderr)
+        return None
+    return [(fd, op, target)], 2
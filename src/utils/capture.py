@@ -0,0 +1,224 @@
+import errno
+import fcntl
+import os
+import sys
+import tempfile
+import termios
+from collections import OrderedDict
+
+# 每次从管道读取的块大小
+CHUNK_SIZE = 64 * 1024
+
+
+def write_all(fd, data):
+    """把 data 完整写入 fd（处理部分写入）"""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def open_capture_pty(term_fd):
+    """
+    创建捕获用的伪终端，返回 (master, slave)；命令的标准输出接到 slave 上。
+    这样命令看到的仍然是终端：保持行缓冲、ls 的分栏和颜色输出，less/vim 等也能正常使用。
+    slave 复制 term_fd 的终端设置和窗口大小，但关闭输出处理（OPOST），
+    换行转换交给真实终端完成，捕获的内容中不会多出 \\r。
+    term_fd 不是终端时（如输出被重定向到文件）退回普通管道。
+    """
+    if not os.isatty(term_fd):
+        return os.pipe()
+    master, slave = os.openpty()
+    try:
+        attrs = termios.tcgetattr(term_fd)
+        attrs[1] &= ~termios.OPOST
+        termios.tcsetattr(slave, termios.TCSANOW, attrs)
+        size = fcntl.ioctl(term_fd, termios.TIOCGWINSZ, b'\0' * 8)
+        fcntl.ioctl(slave, termios.TIOCSWINSZ, size)
+    except OSError:
+        os.close(master)
+        os.close(slave)
+        raise
+    return master, slave
+
+
+class Capture:
+    """一条命令的输出捕获：小输出放内存，超过阈值后转存到匿名临时文件"""
+
+    def __init__(self, capture_id, command, spill_threshold, limit):
+        self.id = capture_id
+        self.command = command
+        self.size = 0
+        self.truncated = False
+        self._buffer = bytearray()
+        self._file = None
+        self._spill_threshold = spill_threshold
+        self._limit = limit
+
+    @property
+    def spilled(self):
+        return self._file is not None
+
+    def append(self, chunk):
+        """追加一块输出；超出单条上限后只标记截断，不再记录"""
+        if self.truncated:
+            return
+        room = self._limit - self.size
+        if len(chunk) > room:
+            chunk = chunk[:room]
+            self.truncated = True
+        if not chunk:
+            return
+
+        if self._file is None and self.size + len(chunk) > self._spill_threshold:
+            # 转存到已删除的临时文件，之后回放可以直接 sendfile
+            self._file = tempfile.TemporaryFile(prefix='mysh-capture-')
+            write_all(self._file.fileno(), self._buffer)
+            self._buffer = bytearray()
+
+        if self._file is None:
+            self._buffer += chunk
+        else:
+            write_all(self._file.fileno(), chunk)
+        self.size += len(chunk)
+
+    def replay(self, out_fd):
+        """把捕获内容写到 out_fd；转存的内容使用零拷贝 sendfile"""
+        if self._file is None:
+            write_all(out_fd, self._buffer)
+            return
+
+        in_fd = self._file.fileno()
+        offset = 0
+        try:
+            while offset < self.size:
+                sent = os.sendfile(out_fd, in_fd, offset, self.size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+        except OSError as e:
+            # 部分终端等目标不支持 sendfile，退回到普通读写
+            if e.errno not in (errno.EINVAL, errno.ENOSYS):
+                raise
+            while offset < self.size:
+                chunk = os.pread(in_fd, min(CHUNK_SIZE, self.size - offset), offset)
+                if not chunk:
+                    break
+                write_all(out_fd, chunk)
+                offset += len(chunk)
+
+    def close(self):
+        """释放捕获占用的内存或临时文件"""
+        self._buffer = bytearray()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class CaptureStore:
+    """最近若干条命令的输出捕获，按总字节预算和条数做 LRU 淘汰"""
+
+    def __init__(self, max_entries=10, byte_budget=64 * 1024 * 1024, spill_threshold=1024 * 1024):
+        self.enabled = False
+        self.max_entries = max_entries
+        self.byte_budget = byte_budget
+        self.spill_threshold = spill_threshold
+        self.captures = OrderedDict()
+        self._next_id = 1
+
+    def total_size(self):
+        return sum(capture.size for capture in self.captures.values())
+
+    def start(self, command):
+        """开始记录一条命令的输出，返回尚未编号的捕获"""
+        return Capture(None, command, self.spill_threshold, self.byte_budget)
+
+    def forward(self, read_fd, out_fd, capture):
+        """
+        从 read_fd（管道或伪终端 master）读取一块命令输出，先原样写到 out_fd（终端），
+        再记录到 capture。
+
+        Returns:
+            bool: 读到数据时为 True，输出端已全部关闭时为 False
+        """
+        try:
+            chunk = os.read(read_fd, CHUNK_SIZE)
+        except OSError as e:
+            # 伪终端的 slave 端全部关闭后，Linux 上读取 master 返回 EIO
+            if e.errno != errno.EIO:
+                raise
+            return False
+        if not chunk:
+            return False
+        write_all(out_fd, chunk)
+        capture.append(chunk)
+        return True
+
+    def commit(self, capture):
+        """为捕获编号并保存，淘汰最久未使用的旧捕获；没有输出的命令不保存"""
+        if capture.size == 0:
+            capture.close()
+            return
+        capture.id = self._next_id
+        self._next_id += 1
+        self.captures[capture.id] = capture
+        while len(self.captures) > 1 and (len(self.captures) > self.max_entries
+                                          or self.total_size() > self.byte_budget):
+            _, oldest = self.captures.popitem(last=False)
+            oldest.close()
+
+    def get(self, capture_id=None):
+        """按编号获取捕获（默认最近一条），并标记为最近使用"""
+        if not self.captures:
+            return None
+        if capture_id is None:
+            capture_id = max(self.captures)
+        capture = self.captures.get(capture_id)
+        if capture is not None:
+            self.captures.move_to_end(capture_id)
+        return capture
+
+    def clear(self):
+        for capture in self.captures.values():
+            capture.close()
+        self.captures.clear()
+
+
+def find_capture(args):
+    """
+    按 replay 的参数 [编号] 取出捕获并标记为最近使用，失败时打印错误并返回 None
+    """
+    capture_id = None
+    if args:
+        try:
+            capture_id = int(args[0])
+        except ValueError:
+            print(f"replay: 无效的编号: {args[0]}", file=sys.stderr)
+            return None
+
+    capture = capture_store.get(capture_id)
+    if capture is None:
+        print("replay: 没有对应的输出捕获", file=sys.stderr)
+    return capture
+
+
+def replay_to_fd(args, out_fd):
+    """
+    执行 replay [编号]，把捕获内容写到 out_fd。
+
+    Returns:
+        int: 退出码
+    """
+    capture = find_capture(args)
+    if capture is None:
+        return 1
+
+    try:
+        capture.replay(out_fd)
+    except BrokenPipeError:
+        pass
+    return 0
+
+
+# 创建全局输出捕获实例
+capture_store = CaptureStore()
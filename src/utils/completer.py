@@ -2,19 +2,27 @@ import os
 import glob
 import re
 
+from utils.variables import variable_store
+
 
 class CommandCompleter:
     def __init__(self, alias_manager=None):
         self.alias_manager = alias_manager
-        self.common_commands = ['cd', 'ls', 'pwd', 'exit', 'help', 'history', 'alias', 'unalias']
+        self.common_commands = ['cd', 'ls', 'pwd', 'exit', 'help', 'history', 'alias', 'unalias',
+                                'export', 'unset', 'set', 'capture', 'replay',
+                                'ulimit', 'jobs', 'admission']
 
         # 从PATH获取系统命令
         self.system_commands = self._get_system_commands()
 
+    def _get_path_dirs(self):
+        """获取 Shell 当前的 PATH 目录列表"""
+        return variable_store.get('PATH', '').split(os.pathsep)
+
     def _get_system_commands(self):
         """从PATH环境变量获取所有可执行命令"""
         commands = set()
-        path_dirs = os.environ.get('PATH', '').split(os.pathsep)
+        path_dirs = self._get_path_dirs()
 
         for path_dir in path_dirs:
             if os.path.isdir(path_dir):
@@ -25,7 +33,27 @@ class CommandCompleter:
                 except (PermissionError, OSError):
                     continue
 
-        return list(commands)
+        return commands
+
+    def rescan_system_commands(self):
+        """重新扫描 PATH 中的全部命令"""
+        self.system_commands = self._get_system_commands()
+
+    def refresh_command(self, name):
+        """PATH 目录中某个文件发生变化时，增量更新该命令是否可用"""
+        for path_dir in self._get_path_dirs():
+            if path_dir and os.access(os.path.join(path_dir, name), os.X_OK):
+                self.system_commands.add(name)
+                return
+        self.system_commands.discard(name)
+
+    def is_command(self, name):
+        """判断 name 是否为可执行的命令（内置命令、别名、PATH 命令或可执行文件路径）"""
+        if name in self.common_commands or name in self.system_commands:
+            return True
+        if self.alias_manager and name in self.alias_manager.aliases:
+            return True
+        return '/' in name and os.path.isfile(name) and os.access(name, os.X_OK)
 
     def get_completions(self, text, cwd):
         """获取补全建议列表"""
@@ -1,11 +1,15 @@
 import os
 import getpass
 import sys
+import unicodedata
 
 def print_prompt():
     """
     打印带颜色的漂亮提示符
     效果：[绿色用户名]@[蓝色路径] $
+
+    Returns:
+        int: 提示符在终端上占用的列数（不含颜色代码）
     """
     # 1. 定义颜色代码 (ANSI Escape Codes)
     GREEN = '\033[92m'  # 亮绿色
@@ -30,6 +34,23 @@ def print_prompt():
 
     # 5. 打印出来 (注意 flush=True 确保立即显示)
     print(prompt_str, end="", flush=True)
+    return display_width(f"[{user}@{cwd}]$ ")
+
+def print_continuation_prompt():
+    """
+    打印续行提示符（引号未闭合、以 | 结尾或行尾为反斜杠时使用）
+
+    Returns:
+        int: 提示符占用的列数
+    """
+    print("> ", end="", flush=True)
+    return 2
+
+def display_width(text):
+    """计算文本在终端上占用的列数（中文等全角字符占两列）"""
+    if text.isascii():
+        return len(text)
+    return sum(2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1 for ch in text)
 
 def print_error(msg):
     """
@@ -0,0 +1,235 @@
+import bisect
+import re
+
+# 词法规则：正则在 C 层完成逐字符扫描，Python 只按 token 循环
+TOKEN_PATTERN = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<redirect>&>>?|\d*[<>]&(?:\d+|-)?|\d*>>|\d*[<>])
+  | (?P<operator>\|\||&&|\||&)
+  | (?P<word>(?:[^\s|&<>'"\\]+|\\.|\\\Z|'[^']*(?:'|\Z)|"(?:[^"\\]|\\.)*(?:"|\\?\Z))+)
+''', re.X | re.S)
+ASSIGNMENT_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*=')
+
+# 解析器不支持的运算符，显示为错误
+UNSUPPORTED_OPERATORS = ('||', '&&')
+# 复制或关闭描述符的重定向（如 2>&1、>&-），后面没有文件名
+DUP_REDIRECT_PATTERN = re.compile(r'&(?:\d+|-)$')
+
+# 各类 token 的颜色（ANSI Escape Codes）
+COLORS = {
+    'command': '\033[92m',     # 亮绿色：有效命令
+    'invalid': '\033[91m',     # 亮红色：无效命令
+    'operator': '\033[95m',    # 亮紫色：| &
+    'redirect': '\033[96m',    # 亮青色：> >> < 2> 2>&1 &> 等
+    'string': '\033[93m',      # 亮黄色：带引号的参数
+    'assignment': '\033[94m',  # 亮蓝色：FOO=bar
+}
+RESET = '\033[0m'
+
+# 文件名长度上限，超过的不可能是 PATH 中的命令
+NAME_MAX = 255
+
+
+class Token:
+    __slots__ = ('start', 'end', 'kind', 'expect_command', 'expect_target')
+
+    def __init__(self, start, end, kind, expect_command, expect_target):
+        self.start = start
+        self.end = end
+        self.kind = kind
+        # 该 token 之后的词法状态，用于从下一个 token 处恢复扫描
+        self.expect_command = expect_command
+        self.expect_target = expect_target
+
+
+def lex(text, command_exists, start=0, expect_command=True, expect_target=False):
+    """从 start 开始扫描 text，返回 Token 列表"""
+    tokens = []
+    pos = start
+    length = len(text)
+    while pos < length:
+        match = TOKEN_PATTERN.match(text, pos)
+        group = match.lastgroup
+        end = match.end()
+
+        if group == 'space':
+            kind = 'space'
+        elif group == 'operator':
+            kind = 'invalid' if match.group() in UNSUPPORTED_OPERATORS else 'operator'
+            expect_command = True
+            expect_target = False
+        elif group == 'redirect':
+            kind = 'redirect'
+            # 2>&1 这类复制描述符的写法后面没有文件名
+            expect_target = not DUP_REDIRECT_PATTERN.search(match.group())
+        else:
+            value = match.group()
+            if expect_target:
+                kind = 'string' if _is_quoted(value) else 'word'
+                expect_target = False
+            elif expect_command and ASSIGNMENT_PATTERN.match(value):
+                kind = 'assignment'
+            elif expect_command:
+                kind = _classify_command(value, command_exists)
+                expect_command = False
+            else:
+                kind = 'string' if _is_quoted(value) else 'word'
+
+        tokens.append(Token(pos, end, kind, expect_command, expect_target))
+        pos = end
+    return tokens
+
+
+def continuation_reason(text, tokens=None):
+    """
+    判断输入是否需要续行。
+
+    Returns:
+        str: 'quote'（引号未闭合）、'backslash'（行尾反斜杠）、'pipe'（以 | 结尾），不需要时为 None
+    """
+    if tokens is None:
+        tokens = lex(text, lambda name: True)
+    for token in reversed(tokens):
+        if token.kind == 'space':
+            continue
+        value = text[token.start:token.end]
+        if token.kind == 'operator':
+            return 'pipe' if value == '|' else None
+        if token.kind == 'invalid' and value in UNSUPPORTED_OPERATORS:
+            return None
+        if _has_open_quote(value):
+            return 'quote'
+        if value.endswith('\\') and _is_escape_at_end(value):
+            return 'backslash'
+        return None
+    return None
+
+
+class SyntaxHighlighter:
+    """
+    增量语法高亮：缓存 token 及其后的词法状态，编辑时只从被编辑的 token 开始重新扫描，
+    并计算屏幕上第一个需要重绘的位置。
+    """
+
+    def __init__(self, command_exists):
+        self._command_exists = command_exists
+        self._command_cache = {}
+        self.base = ''
+        self.text = ''
+        self.tokens = []
+        self._starts = []
+
+    def reset(self, base=''):
+        """开始新的一行；base 是续行之前已输入的内容，只参与词法分析，不显示"""
+        self._command_cache = {}
+        self.base = base
+        self.text = base
+        self.tokens = lex(base, self._cached_command_exists)
+        self._starts = [token.start for token in self.tokens]
+
+    def update(self, line, edit_pos):
+        """
+        当前行内容变为 line（编辑发生在行内 edit_pos 处）后增量重新扫描。
+
+        Returns:
+            int: 行内第一个显示可能变化的位置
+        """
+        offset = len(self.base)
+        text = self.base + line
+        edit = offset + edit_pos
+
+        # 从包含 edit-1 的 token 再往前两个 token 开始重扫，
+        # 因为编辑可能使前面的 token 合并（如 2> & 1 -> 2>&1）
+        index = max(bisect.bisect_right(self._starts, max(edit - 1, 0)) - 3, 0)
+        old_tokens = self.tokens
+        if index < len(old_tokens):
+            start = old_tokens[index].start
+            prev = old_tokens[index - 1] if index > 0 else None
+            new_tail = lex(text, self._cached_command_exists, start,
+                           prev.expect_command if prev else True,
+                           prev.expect_target if prev else False)
+        else:
+            new_tail = lex(text, self._cached_command_exists)
+            index = 0
+
+        # 编辑位置之前文字不变，但所在 token 的颜色可能变化（如 l -> ls 变为有效命令）
+        first_diff = edit
+        for j, token in enumerate(new_tail, index):
+            if token.start >= edit:
+                break
+            if j >= len(old_tokens) or old_tokens[j].start != token.start or old_tokens[j].kind != token.kind:
+                first_diff = token.start
+                break
+            if old_tokens[j].end < min(token.end, edit):
+                # 旧 token 在编辑位置之前就结束了，后面的字符被合并进新 token，颜色可能变化
+                first_diff = old_tokens[j].end
+                break
+
+        self.text = text
+        self.tokens = old_tokens[:index] + new_tail
+        self._starts = self._starts[:index] + [token.start for token in new_tail]
+        return max(first_diff - offset, 0)
+
+    def render(self, line_pos=0):
+        """渲染当前行从 line_pos 开始的带颜色文本"""
+        offset = len(self.base)
+        pos = offset + line_pos
+        index = max(bisect.bisect_right(self._starts, pos) - 1, 0)
+        parts = []
+        for token in self.tokens[index:]:
+            segment = self.text[max(token.start, pos):token.end]
+            if not segment:
+                continue
+            color = COLORS.get(token.kind)
+            if color:
+                parts.append(color + segment + RESET)
+            else:
+                parts.append(segment)
+        return ''.join(parts)
+
+    def continuation(self):
+        """当前输入（含续行前的内容）是否需要续行"""
+        return continuation_reason(self.text, self.tokens)
+
+    def _cached_command_exists(self, name):
+        if len(name) > NAME_MAX and '/' not in name:
+            return False
+        result = self._command_cache.get(name)
+        if result is None:
+            result = self._command_exists(name)
+            self._command_cache[name] = result
+        return result
+
+
+def _is_quoted(value):
+    return "'" in value or '"' in value
+
+
+def _classify_command(value, command_exists):
+    """命令名中含引号、变量或转义时无法静态判断，只按普通参数显示"""
+    if any(ch in value for ch in '\'"\\$'):
+        return 'string' if _is_quoted(value) else 'word'
+    return 'command' if command_exists(value) else 'invalid'
+
+
+def _has_open_quote(value):
+    """检查单个 word 中是否有未闭合的引号"""
+    quote = None
+    i = 0
+    while i < len(value):
+        ch = value[i]
+        if ch == '\\' and quote != "'":
+            i += 2
+            continue
+        if quote is None and ch in ('"', "'"):
+            quote = ch
+        elif ch == quote:
+            quote = None
+        i += 1
+    return quote is not None
+
+
+def _is_escape_at_end(value):
+    """行尾反斜杠是否未被转义（奇数个反斜杠）"""
+    stripped = value.rstrip('\\')
+    return (len(value) - len(stripped)) % 2 == 1
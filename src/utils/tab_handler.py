@@ -13,6 +13,7 @@ class TabHandler:
         text_before_cursor = current_input[:cursor_pos]
         completions = self.completer.get_completions(text_before_cursor, cwd)
 
+        self.last_completions = completions
         if not completions:
             return current_input, cursor_pos, False
 
@@ -23,14 +24,15 @@ class TabHandler:
             )
             return new_input, new_pos, True
         else:
-            print()
+            # 终端处于原始模式，换行需要同时输出 \r；之后由调用方重新显示提示符和输入
+            output = ['\r\n']
             for i, comp in enumerate(completions):
                 if i % 4 == 0:
-                    print()
-                print(f"{comp:<20}", end="")
-            print()
+                    output.append('\r\n')
+                output.append(f"{comp:<20}")
+            output.append('\r\n')
 
-            sys.stdout.write(current_input)
+            sys.stdout.write(''.join(output))
             sys.stdout.flush()
 
             return current_input, cursor_pos, False
@@ -0,0 +1,160 @@
+import os
+import re
+
+# 变量名与前缀赋值（FOO=bar）的匹配规则
+NAME_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+ASSIGNMENT_PATTERN = re.compile(r'^([A-Za-z_][A-Za-z0-9_]*)=(.*)$', re.S)
+
+
+class VariableStore:
+    """Shell 变量表：保存所有变量，并记录哪些变量需要导出给子进程"""
+
+    def __init__(self, environ=None):
+        if environ is None:
+            environ = os.environ
+        self.variables = dict(environ)
+        self.exported = set(self.variables)
+        self.last_status = 0
+        # 编码后的环境块缓存，只有导出变量变化时才重建
+        self._envp_cache = None
+
+    def get(self, name, default=None):
+        """读取变量值（支持 $? 和 $$ 特殊变量）"""
+        if name == '?':
+            return str(self.last_status)
+        if name == '$':
+            return str(os.getpid())
+        return self.variables.get(name, default)
+
+    def set(self, name, value, export=False):
+        """设置变量；已导出的变量或 export=True 时会使环境块缓存失效"""
+        self.variables[name] = value
+        if export:
+            self.exported.add(name)
+        if name in self.exported:
+            self._envp_cache = None
+
+    def export(self, name, value=None):
+        """导出变量（可同时赋值）"""
+        if value is not None:
+            self.variables[name] = value
+        elif name not in self.variables:
+            self.variables[name] = ''
+        self.exported.add(name)
+        self._envp_cache = None
+
+    def unset(self, name):
+        """删除变量，返回是否存在"""
+        if name not in self.variables:
+            return False
+        del self.variables[name]
+        if name in self.exported:
+            self.exported.discard(name)
+            self._envp_cache = None
+        return True
+
+    def list_variables(self):
+        """列出所有变量"""
+        return dict(sorted(self.variables.items()))
+
+    def list_exported(self):
+        """列出所有导出变量"""
+        return {name: self.variables[name] for name in sorted(self.exported)}
+
+    def build_envp(self, overlay=None):
+        """
+        构建传给 execve 的环境块。
+
+        Args:
+            overlay (list): 前缀赋值 [(name, value), ...]，只作用于本次子进程
+
+        Returns:
+            dict: bytes -> bytes 的环境映射。无 overlay 时直接返回缓存，调用方不得修改。
+        """
+        if self._envp_cache is None:
+            self._envp_cache = {
+                os.fsencode(name): os.fsencode(self.variables[name])
+                for name in self.exported
+            }
+        if not overlay:
+            return self._envp_cache
+
+        envp = self._envp_cache.copy()
+        for name, value in overlay:
+            envp[os.fsencode(name)] = os.fsencode(value)
+        return envp
+
+    def expand_word(self, segments, split=True):
+        """
+        展开一个已分词 word 中的 $VAR、${VAR}、$?、$$。
+
+        Args:
+            segments (list): 分词得到的片段 [(文本, 引号), ...]，单引号和转义的片段不展开
+            split (bool): 是否按空白拆分未加引号的展开结果（前缀赋值中不拆分）
+
+        Returns:
+            list: 展开后的字段。展开结果只会成为普通参数，其中的引号和运算符不再被解析
+        """
+        fields = []
+        current = []
+        quoted = False  # 当前字段是否含有引号（这样的字段即使为空也保留）
+        for text, quote in segments:
+            if quote is not None:
+                quoted = True
+            if quote == "'" or '$' not in text:
+                current.append(text)
+                continue
+
+            i = 0
+            while i < len(text):
+                start = text.find('$', i)
+                if start == -1:
+                    current.append(text[i:])
+                    break
+                current.append(text[i:start])
+                name, end = self._scan_name(text, start + 1)
+                if name is None:
+                    current.append('$')
+                    i = start + 1
+                    continue
+                value = self.get(name, '')
+                i = end
+                if quote == '"' or not split:
+                    current.append(value)
+                    continue
+                # 未加引号的展开结果按空白拆分为多个字段
+                pieces = re.split(r'\s+', value)
+                current.append(pieces[0])
+                for piece in pieces[1:]:
+                    field = ''.join(current)
+                    if field or quoted:
+                        fields.append(field)
+                    current = [piece]
+                    quoted = False
+
+        field = ''.join(current)
+        if field or quoted:
+            fields.append(field)
+        return fields
+
+    @staticmethod
+    def _scan_name(text, start):
+        """从 start 处识别变量名，返回 (变量名, 结束位置)，无法识别时变量名为 None"""
+        if start >= len(text):
+            return None, start
+        ch = text[start]
+        if ch in ('?', '$'):
+            return ch, start + 1
+        if ch == '{':
+            end = text.find('}', start)
+            if end != -1 and NAME_PATTERN.fullmatch(text, start + 1, end):
+                return text[start + 1:end], end + 1
+            return None, start
+        match = NAME_PATTERN.match(text, start)
+        if match:
+            return match.group(0), match.end()
+        return None, start
+
+
+# 创建全局变量表实例
+variable_store = VariableStore()
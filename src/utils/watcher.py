@@ -0,0 +1,176 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+
+from utils.variables import variable_store
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_MASK_ADD = 0x20000000
+
+# PATH 目录中可能影响命令列表的事件
+PATH_EVENTS = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE \
+    | IN_DELETE_SELF | IN_MOVE_SELF
+# 别名配置所在目录的事件（编辑器常用“写临时文件再改名”的方式保存；文件被删除或移走时清空别名）
+CONFIG_EVENTS = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_MOVED_FROM
+
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class Inotify:
+    """通过 ctypes 调用 Linux inotify 接口（非阻塞读取）"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path, mask):
+        """添加监视，返回 watch 描述符（同一目录被多次监视时掩码合并）"""
+        wd = self._add_watch(self.fd, os.fsencode(path), mask | IN_MASK_ADD)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """读取当前所有待处理事件，返回 [(wd, mask, name), ...]，没有事件时立即返回"""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ShellWatcher:
+    """
+    监视 PATH 目录和别名配置文件的变化，在每次显示提示符前非阻塞地轮询。
+    PATH 中的命令增删只对补全数据做增量更新；别名只有内容确实变化时才重新加载。
+    暂时不存在的 PATH 目录（如尚未创建的 ~/.local/bin，或被删除后重建的目录）
+    每次轮询时重新检查，出现后立即开始监视。
+    """
+
+    def __init__(self, alias_manager, completer=None):
+        self.alias_manager = alias_manager
+        self.completer = completer
+        self.inotify = Inotify()
+        self.path = None
+        self.path_watches = {}  # wd -> 目录
+        self.missing_dirs = set()  # PATH 中尚未被监视的目录
+
+        config_dir, self.config_name = os.path.split(alias_manager.config_file)
+        try:
+            self.config_wd = self.inotify.add_watch(config_dir, CONFIG_EVENTS)
+        except OSError:
+            self.config_wd = None
+        self._sync_path()
+
+    def _sync_path(self):
+        """PATH 变化时重新建立目录监视，返回是否发生了变化"""
+        path = variable_store.get('PATH', '')
+        if path == self.path:
+            return False
+        self.path = path
+
+        for wd in self.path_watches:
+            if wd != self.config_wd:
+                self.inotify.rm_watch(wd)
+        self.path_watches = {}
+        self.missing_dirs = {path_dir for path_dir in path.split(os.pathsep) if path_dir}
+        self._watch_missing()
+        return True
+
+    def _watch_missing(self):
+        """尝试监视尚未被监视的 PATH 目录，返回是否新增了监视"""
+        added = False
+        for path_dir in list(self.missing_dirs):
+            if not os.path.isdir(path_dir):
+                continue
+            try:
+                wd = self.inotify.add_watch(path_dir, PATH_EVENTS)
+            except OSError:
+                continue
+            self.path_watches[wd] = path_dir
+            self.missing_dirs.discard(path_dir)
+            added = True
+        return added
+
+    def poll(self):
+        """处理所有待处理的事件（不阻塞）"""
+        rescan = self._sync_path()
+        changed_commands = set()
+        reload_config = False
+
+        for wd, mask, name in self.inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出，无法知道具体变化，全部重新加载
+                rescan = True
+                reload_config = True
+            elif mask & IN_IGNORED:
+                # 目录被删除或移走，监视已失效，等它重新出现时再监视
+                path_dir = self.path_watches.pop(wd, None)
+                if path_dir is not None:
+                    self.missing_dirs.add(path_dir)
+            elif wd == self.config_wd and name == self.config_name:
+                reload_config = True
+            elif wd in self.path_watches:
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    rescan = True
+                elif name:
+                    changed_commands.add(name)
+
+        # 新出现的目录中的命令都要加入补全数据
+        if self.missing_dirs and self._watch_missing():
+            rescan = True
+
+        if self.completer is not None:
+            if rescan:
+                self.completer.rescan_system_commands()
+            else:
+                for name in changed_commands:
+                    self.completer.refresh_command(name)
+        if reload_config:
+            self.alias_manager.reload_aliases()
+
+    def close(self):
+        self.inotify.close()
+
+
+def create_watcher(alias_manager, completer=None):
+    """创建监视器；系统不支持 inotify 时返回 None"""
+    try:
+        return ShellWatcher(alias_manager, completer)
+    except (OSError, AttributeError):
+        return None